@@ -0,0 +1,86 @@
+#
+#  Capture files for IT-100 traffic
+#
+#  A capture file holds the raw bytes received from the IT-100 along
+#  with when they were received.  Each connection appends a block to
+#  the file, a short header followed by one record per receive:
+#
+#    uint32  milliseconds since the start of the block
+#    uint16  length of the data
+#    bytes   data
+#
+#  All values are little endian.  Record times restart at 0 in each
+#  block.  A connection that lasts longer than the time field can hold
+#  (about 49 days) starts a new block.
+
+import logging
+import struct
+import threading
+import time
+
+MAGIC = b'DSCCAP1\n'
+RECORD = struct.Struct('<IH')
+MAX_RECORD = 0xffff
+MAX_TIME = 0xffffffff   # milliseconds
+
+_LOGGER = logging.getLogger(__name__)
+
+class CaptureWriter:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        # append so a reconnect doesn't lose what was already captured
+        self.fp = open(path, 'ab')
+        self.fp.write(MAGIC)
+        self.start = time.monotonic()
+
+    def write(self, data):
+        with self.lock:
+            if self.fp is None:
+                return
+            ms = int((time.monotonic() - self.start) * 1000)
+            if ms > MAX_TIME:
+                self.fp.write(MAGIC)
+                self.start = time.monotonic()
+                ms = 0
+            for i in range(0, len(data), MAX_RECORD):
+                chunk = data[i:i + MAX_RECORD]
+                self.fp.write(RECORD.pack(ms, len(chunk)))
+                self.fp.write(chunk)
+            self.fp.flush()
+
+    def close(self):
+        with self.lock:
+            if self.fp is not None:
+                self.fp.close()
+                self.fp = None
+
+"""
+    Read a capture file.  Yields (seconds, data) for each record where
+    seconds is the time since the start of the capture.  Blocks follow
+    each other, each one starting where the previous one ended.
+"""
+def read_capture(path):
+    with open(path, 'rb') as fp:
+        if fp.read(len(MAGIC)) != MAGIC:
+            raise ValueError('{} is not an IT-100 capture file'.format(path))
+
+        base = 0.0
+        last = 0.0
+        while True:
+            pos = fp.tell()
+            if fp.read(len(MAGIC)) == MAGIC:
+                base = last
+                continue
+            fp.seek(pos)
+
+            header = fp.read(RECORD.size)
+            if len(header) < RECORD.size:
+                break
+            ms, length = RECORD.unpack(header)
+            data = fp.read(length)
+            if len(data) < length:
+                _LOGGER.warning('Capture file {} is truncated'.format(path))
+                break
+            last = base + ms / 1000.0
+            yield (last, data)
@@ -0,0 +1,104 @@
+#
+#  Zone chatter detection
+#
+#  Tracks the open/restore transition rate of each zone over a sliding
+#  window.  The window is split into a fixed number of buckets so the
+#  memory used is the same no matter how busy a zone is.
+
+import time
+
+MAX_ZONES = 64
+DEFAULT_THRESHOLD = 120   # transitions per hour
+
+class ChatterMonitor:
+    def __init__(self, threshold=DEFAULT_THRESHOLD, window=3600, buckets=12, zones=MAX_ZONES):
+        self.threshold = int(threshold)   # transitions per window
+        self.window = int(window)         # seconds
+        self.buckets = int(buckets)
+        self.zones = zones
+        self.bucket_len = self.window / self.buckets
+
+        # one row of bucket counts per zone, zone 0 is unused
+        self.counts = [0] * ((zones + 1) * self.buckets)
+        self.current = [0] * (zones + 1)   # bucket number last written
+        self.totals = [0] * (zones + 1)
+        self.flagged = [False] * (zones + 1)
+
+    # Move the zone's window forward to bucket number 'now_bucket',
+    # dropping counts that have aged out.
+    def _advance(self, zone, now_bucket):
+        last = self.current[zone]
+        if now_bucket <= last:
+            return
+
+        base = zone * self.buckets
+        if now_bucket - last >= self.buckets:
+            for i in range(base, base + self.buckets):
+                self.counts[i] = 0
+            self.totals[zone] = 0
+        else:
+            for b in range(last + 1, now_bucket + 1):
+                i = base + (b % self.buckets)
+                self.totals[zone] -= self.counts[i]
+                self.counts[i] = 0
+
+        self.current[zone] = now_bucket
+
+    def _bucket(self, now):
+        if now is None:
+            now = time.monotonic()
+        return int(now / self.bucket_len)
+
+    def valid(self, zone):
+        return 0 < zone <= self.zones
+
+    """
+        Record a transition for the zone.  Returns True if the zone's
+        chatter flag changed.
+    """
+    def record(self, zone, now=None):
+        if not self.valid(zone):
+            return False
+
+        b = self._bucket(now)
+        self._advance(zone, b)
+        self.counts[zone * self.buckets + (b % self.buckets)] += 1
+        self.totals[zone] += 1
+        return self._evaluate(zone)
+
+    """
+        Re-evaluate the zone against the current time.  Used from poll
+        so that a zone that goes quiet has its flag cleared.  Returns
+        True if the chatter flag changed.
+    """
+    def update(self, zone, now=None):
+        if not self.valid(zone):
+            return False
+
+        self._advance(zone, self._bucket(now))
+        return self._evaluate(zone)
+
+    # Flag when the rate goes over the threshold and clear when it
+    # drops to half of it so a zone near the limit doesn't flap.
+    def _evaluate(self, zone):
+        total = self.totals[zone]
+        if self.threshold <= 0:
+            flag = False
+        elif self.flagged[zone]:
+            flag = total > self.threshold // 2
+        else:
+            flag = total > self.threshold
+
+        changed = flag != self.flagged[zone]
+        self.flagged[zone] = flag
+        return changed
+
+    def rate(self, zone):
+        if not self.valid(zone):
+            return 0
+        return self.totals[zone]
+
+    def is_chattering(self, zone):
+        if not self.valid(zone):
+            return False
+        return self.flagged[zone]
@@ -3,11 +3,13 @@
 Polyglot v3 node server for DSC alarm panel control/status via IT-100
 Copyright (C) 2020,2021 Robert Paauwe
 """
-import sys
 import time
+# Taken before the rest of the imports so the startup time that gets
+# logged includes loading udi_interface.
+STARTED = time.monotonic()
+
+import sys
 import udi_interface
-from nodes import dsc
-from nodes import zone
 
 LOGGER = udi_interface.LOGGER
 
@@ -15,9 +17,14 @@ if __name__ == "__main__":
     try:
         polyglot = udi_interface.Interface([])
         polyglot.start('2.0.1')
+
+        # Import the node server after start() so the connection to
+        # Polyglot is being set up while these load.
+        from nodes import dsc
+
         dsc.Controller(polyglot, 'controller', 'controller', 'DSC')
+        LOGGER.info('Startup took {:.3f} seconds'.format(time.monotonic() - STARTED))
         polyglot.runForever()
     except (KeyboardInterrupt, SystemExit):
         sys.exit(0)
-        
 
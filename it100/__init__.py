@@ -1,75 +1,96 @@
 import logging
-import time
-import socket
-import threading
 import protocol
+from it100 import transport
 
 _LOGGER = logging.getLogger(__name__)
 
+MAX_FRAME = 1024
+
+## Split the byte stream from the IT-100 into messages
+class FrameParser:
+    def __init__(self):
+        self.buf = bytearray()
+
+    def feed(self, data):
+        messages = []
+        self.buf += data
+        while True:
+            end = self.buf.find(b'\n')  # looking for end byte
+            if end < 0:
+                break
+            frame = bytes(self.buf[:end + 1])
+            del self.buf[:end + 1]
+            messages.append(protocol.DSCMessage.deserialize(frame))
+
+        if len(self.buf) > MAX_FRAME:
+            _LOGGER.error('Discarding {} bytes with no end of message'.format(len(self.buf)))
+            self.buf.clear()
+
+        return messages
+
 class DSCConnection:
-    def __init__(self, ipaddress, port):
-        self.ip = ipaddress
-        self.port = int(port)
+    def __init__(self, link):
+        self.link = link
         self.connected = False
-        self.sock = None
+        self.parser = FrameParser()
+        self.capture = None
 
 
     def processCommand(msg):
         logging.warning(' -> TODO: message ' + str(msg))
 
-    ## Connect to the IT-100 via IP address (serial/IP adaptor)
+    ## Connect to the IT-100 using the configured transport
     def Connect(self):
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         try:
-            self.sock.connect(('192.168.92.56', 4999))
-            self.sock.setblocking(False)
-            logging.warning('Successfully connected to IT-100 via iTach.')
+            self.link.open()
+            self.parser = FrameParser()
+            logging.warning('Successfully connected to IT-100 via {}.'.format(self.link))
             self.connected = True
-        except socket.error as msg:
+        except (OSError, ValueError) as msg:
             _LOGGER.error('Error trying to connect to IT-100 controller.')
             _LOGGER.error(msg)
 
     def Close(self):
-        self.sock.close()
-        self.sock = None
         self.connected = False
+        self.link.close()
+
+    def Send(self, cmd):
+        logging.debug('[{}]'.format(', '.join(hex(x) for x in cmd.serialize())))
+        try:
+            self.link.send(cmd.serialize())
+        except OSError as msg:
+            _LOGGER.error('Failed to send to IT-100: ' + str(msg))
+            self.connected = False
 
     def StatusRequest(self):
-        cmd = protocol.DSCMessage(protocol.CMD_STATUS_REQUEST, b'')
-        logging.warning('[{}]'.format(', '.join(hex(x) for x in cmd.serialize())))
-        self.sock.send(cmd.serialize())
+        self.Send(protocol.DSCMessage(protocol.CMD_STATUS_REQUEST, b''))
 
     def LabelRequest(self):
-        cmd = protocol.DSCMessage(protocol.CMD_LABELS_REQUEST, b'')
-        logging.warning('[{}]'.format(', '.join(hex(x) for x in cmd.serialize())))
-        self.sock.send(cmd.serialize())
+        self.Send(protocol.DSCMessage(protocol.CMD_LABELS_REQUEST, b''))
 
-    def Loop(self, handler):
+    # handler is called for each message and flush, if given, after
+    # all of the messages from a receive have been handled.
+    def Loop(self, handler, flush=None):
         # Main loop waits for messages from IT-100 and then processes them
         #status_request()
-        buf = bytearray(100)
-        st = 0
         while self.connected:
             try:
-                tcp = self.sock.recv(4096)
-                #logging.warning('len= %s data= %s', len(tcp), '[{}]'.format(', '.join(hex(x) for x in tcp)))
-
-                data = tcp[0:]
-                for b in data:
-                    if b == 0x0a:  # looking for end byte
-                        buf[st] = b
-                        message = protocol.DSCMessage.deserialize(buf[0:st+1])
-                        handler(message)
-                        st = 0
-                    else:
-                        buf[st] = b
-                        st += 1
-
-            except BlockingIOError:
-                _LOGGER.info('waiting on data')
-                pass
-            except ConnectionResetError as msg:
-                _LOGGER.error('Connection error: ' + str(msg))
+                data = self.link.recv(4096)
+                if not data:
+                    continue
+                #logging.warning('len= %s data= %s', len(data), '[{}]'.format(', '.join(hex(x) for x in data)))
+
+                if self.capture is not None:
+                    self.capture.write(data)
+
+                for message in self.parser.feed(data):
+                    handler(message)
+                if flush is not None:
+                    flush()
+
+            except OSError as msg:
+                if self.connected:
+                    _LOGGER.error('Connection error: ' + str(msg))
                 self.connected = False
 
 
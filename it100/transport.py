@@ -0,0 +1,225 @@
+#
+#  Transports used to talk to the IT-100
+#
+#  The IT-100 is a serial device.  It can be connected directly to a
+#  serial port or through a serial/IP bridge (like an iTach) using
+#  TCP or UDP.  Each transport provides the same interface so the
+#  connection doesn't care which one is used.
+
+import logging
+import os
+import select
+import socket
+
+_LOGGER = logging.getLogger(__name__)
+
+TCP = 'tcp'
+UDP = 'udp'
+SERIAL = 'serial'
+
+DEFAULT_BAUD = 9600   # IT-100 default
+TIMEOUT = 1.0         # seconds to wait in recv before returning
+
+# Seconds to wait for a TCP connection.  Connecting blocks the
+# controller's thread so this is kept short.
+CONNECT_TIMEOUT = 2.0
+
+class Transport:
+    name = 'none'
+
+    def open(self):
+        raise NotImplementedError
+
+    def close(self):
+        raise NotImplementedError
+
+    """
+        Send all of data.  Raises ConnectionError if the link is closed
+        or has been lost.
+    """
+    def send(self, data):
+        raise NotImplementedError
+
+    """
+        Return the data received or b'' if nothing arrived before the
+        timeout.  Raises ConnectionError if the link has been lost.
+    """
+    def recv(self, size):
+        raise NotImplementedError
+
+    def __str__(self):
+        return self.name
+
+
+class TCPTransport(Transport):
+    name = TCP
+
+    def __init__(self, host, port, timeout=TIMEOUT):
+        self.host = host
+        self.port = int(port)
+        self.timeout = timeout
+        self.sock = None
+
+    def open(self):
+        self.sock = socket.create_connection((self.host, self.port), timeout=CONNECT_TIMEOUT)
+        self.sock.settimeout(self.timeout)
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def send(self, data):
+        sock = self.sock
+        if sock is None:
+            raise ConnectionResetError('Connection to {}:{} is closed'.format(self.host, self.port))
+        sock.sendall(data)
+
+    def recv(self, size):
+        sock = self.sock
+        if sock is None:
+            raise ConnectionResetError('Connection to {}:{} is closed'.format(self.host, self.port))
+        try:
+            data = sock.recv(size)
+        except socket.timeout:
+            return b''
+        if data == b'':
+            raise ConnectionResetError('Connection closed by {}:{}'.format(self.host, self.port))
+        return data
+
+    def __str__(self):
+        return 'tcp {}:{}'.format(self.host, self.port)
+
+
+class UDPTransport(Transport):
+    name = UDP
+
+    def __init__(self, host, port, timeout=TIMEOUT):
+        self.host = host
+        self.port = int(port)
+        self.timeout = timeout
+        self.sock = None
+
+    def open(self):
+        # connect() only sets the default destination and filters
+        # datagrams to those from the bridge.
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.connect((self.host, self.port))
+        self.sock.settimeout(self.timeout)
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def send(self, data):
+        sock = self.sock
+        if sock is None:
+            raise ConnectionResetError('Connection to {}:{} is closed'.format(self.host, self.port))
+        sock.send(data)
+
+    def recv(self, size):
+        sock = self.sock
+        if sock is None:
+            raise ConnectionResetError('Connection to {}:{} is closed'.format(self.host, self.port))
+        try:
+            # read the whole datagram, anything past size would be lost
+            return sock.recv(max(size, 65535))
+        except socket.timeout:
+            return b''
+
+    def __str__(self):
+        return 'udp {}:{}'.format(self.host, self.port)
+
+
+class SerialTransport(Transport):
+    name = SERIAL
+
+    def __init__(self, device, baud=DEFAULT_BAUD, timeout=TIMEOUT):
+        self.device = device
+        self.baud = int(baud)
+        self.timeout = timeout
+        self.fd = None
+
+    def open(self):
+        # termios is only available on POSIX systems, which is all
+        # Polyglot runs on.
+        import termios
+
+        speed = getattr(termios, 'B' + str(self.baud), None)
+        if speed is None:
+            raise ValueError('Unsupported baud rate {}'.format(self.baud))
+
+        fd = os.open(self.device, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+        try:
+            # raw, 8 data bits, no parity, 1 stop bit
+            attr = termios.tcgetattr(fd)
+            attr[0] = termios.IGNBRK | termios.IGNPAR          # iflag
+            attr[1] = 0                                         # oflag
+            attr[2] = termios.CS8 | termios.CREAD | termios.CLOCAL  # cflag
+            attr[3] = 0                                         # lflag
+            attr[4] = speed                                     # ispeed
+            attr[5] = speed                                     # ospeed
+            attr[6][termios.VMIN] = 0
+            attr[6][termios.VTIME] = 0
+            termios.tcsetattr(fd, termios.TCSANOW, attr)
+            termios.tcflush(fd, termios.TCIOFLUSH)
+        except Exception:
+            os.close(fd)
+            raise
+
+        self.fd = fd
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def send(self, data):
+        fd = self.fd
+        if fd is None:
+            raise ConnectionResetError('Serial device {} is closed'.format(self.device))
+        view = memoryview(data)
+        while len(view):
+            try:
+                n = os.write(fd, view)
+            except BlockingIOError:
+                select.select([], [fd], [], self.timeout)
+                continue
+            view = view[n:]
+
+    def recv(self, size):
+        # Close() may be called from another thread
+        fd = self.fd
+        if fd is None:
+            raise ConnectionResetError('Serial device {} is closed'.format(self.device))
+        (ready, _, _) = select.select([fd], [], [], self.timeout)
+        if not ready:
+            return b''
+        try:
+            data = os.read(fd, size)
+        except BlockingIOError:
+            return b''
+        if data == b'':
+            raise ConnectionResetError('Serial device {} closed'.format(self.device))
+        return data
+
+    def __str__(self):
+        return 'serial {} at {} baud'.format(self.device, self.baud)
+
+
+"""
+    Create a transport from the node server configuration.  kind is one
+    of 'tcp', 'udp' or 'serial'.  address and port are used for the
+    network transports and device and baud for serial.
+"""
+def create(kind, address=None, port=None, device=None, baud=DEFAULT_BAUD):
+    kind = (kind or TCP).lower()
+    if kind == TCP:
+        return TCPTransport(address, port)
+    elif kind == UDP:
+        return UDPTransport(address, port)
+    elif kind == SERIAL:
+        return SerialTransport(device, baud)
+
+    raise ValueError('Unknown transport ' + str(kind))
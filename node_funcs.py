@@ -1,14 +1,9 @@
 #
 #  Common functions used by nodes
 
+import udi_interface
 
-try:
-    import polyinterface
-except ImportError:
-    import pgc_interface as polyinterface
-
-
-LOGGER = polyinterface.LOGGER
+LOGGER = udi_interface.LOGGER
 
 """
     Some common functions to be used by node servers
@@ -5,20 +5,45 @@ Copyright (C) 2020,2021 Robert Paauwe
 """
 
 import udi_interface
-import sys
 import time
-import datetime
-import requests
 import threading
-import socket
-import math
+import queue
 import protocol
 import it100
+import chatter
+import trouble
+import timesync
 from nodes import zone
 
 LOGGER = udi_interface.LOGGER
 Custom = udi_interface.Custom
 
+# trouble bit to driver mapping for the controller and zone nodes
+PANEL_TROUBLES = [
+        ('GV1', trouble.BELL),
+        ('GV2', trouble.BATTERY),
+        ('GV3', trouble.AC),
+        ('GV4', trouble.FTC),
+        ('GV5', trouble.TAMPER),
+        ('GV6', trouble.DEVICE_LOW_BATTERY),
+        ('GV7', trouble.FIRE),
+        ('GV8', trouble.KEYBUS),
+        ('GV9', trouble.PARTITION_TROUBLE),
+        ]
+
+ZONE_TROUBLES = [
+        ('GV3', trouble.ZONE_TAMPER),
+        ('GV4', trouble.ZONE_FAULT),
+        ('GV5', trouble.ZONE_LOW_BATTERY),
+        ]
+
+"""
+  All of the controller's state is owned by a single thread.  Polyglot
+  callbacks and the IT-100 receive thread don't change anything
+  themselves, they post the work to the owner thread's queue.  Methods
+  starting with _ and the message handlers must only be called on the
+  owner thread.
+"""
 class Controller(udi_interface.Node):
     id = 'dsc'
 
@@ -29,14 +54,30 @@ class Controller(udi_interface.Node):
         self.address = address
         self.primary = primary
         self.configured = False
+        self.started = False
         self.dsc = None
         self.mesg_thread = None
         self.discovery_ok = False
         self.zone_map = {}
+        self.chatter = chatter.ChatterMonitor()
+        self.chatter_collapse = False
+        self.zone_state = {}
+        self.troubles = trouble.TroubleModel()
+        self.timesync = timesync.TimeSync()
+        self.event_time = None
+        self.capture_file = None
+        self.capture = None
+        self.transport = it100.transport.TCP
+        self.baud = it100.transport.DEFAULT_BAUD
 
         self.Parameters = Custom(polyglot, 'customparams')
         self.Notices = Custom(polyglot, 'notices')
 
+        self.queue = queue.Queue()
+        self.owner = threading.Thread(target=self._run, name='dsc-controller')
+        self.owner.daemon = True
+        self.owner.start()
+
         self.poly.subscribe(polyglot.CUSTOMPARAMS, self.parameterHandler)
         self.poly.subscribe(polyglot.START, self.start, address)
         self.poly.subscribe(polyglot.POLL, self.poll)
@@ -45,68 +86,223 @@ class Controller(udi_interface.Node):
         self.poly.addNode(self)
 
 
+    def _run(self):
+        while True:
+            (func, args, done) = self.queue.get()
+            try:
+                func(*args)
+            except Exception:
+                LOGGER.exception('Error in {}'.format(func.__name__))
+            finally:
+                if done is not None:
+                    done.set()
+
+    """
+      Queue func to run on the owner thread.  With wait, block until it
+      has run (or timeout seconds have passed).
+    """
+    def post(self, func, *args, wait=False, timeout=30):
+        if not wait:
+            self.queue.put((func, args, None))
+            return True
+
+        if threading.current_thread() is self.owner:
+            func(*args)
+            return True
+
+        done = threading.Event()
+        self.queue.put((func, args, done))
+        return done.wait(timeout)
+
+    # Wait for everything queued so far to be processed.
+    def sync(self, timeout=30):
+        return self.post(lambda: None, wait=True, timeout=timeout)
+
     # Process changes to customParameters
     def parameterHandler(self, params):
+        self.post(self._parameters, params)
+
+    def _parameters(self, params):
         self.Parameters.load(params)
         self.configured = False
         validIP = False
         validPort = False
+        validDevice = False
 
         self.Notices.clear()
+        self.capture_file = None
+        self.transport = it100.transport.TCP
+        self.baud = it100.transport.DEFAULT_BAUD
+        self.timesync.interval = timesync.DEFAULT_INTERVAL
+        self.timesync.timestamps = False
+        self.chatter.threshold = chatter.DEFAULT_THRESHOLD
+        self.chatter_collapse = False
 
         for p in self.Parameters:
             if 'IP Address' in p:
-                if self.Parameters[p] is not '':
+                if self.Parameters[p]:
                     validIP = True
-                else:
-                    self.Notices['ip'] = 'IP Address of serial network interface must be set.'
+            elif 'Serial Port' in p:
+                if self.Parameters[p]:
+                    validDevice = True
+            elif 'Baud Rate' in p:
+                try:
+                    self.baud = int(self.Parameters[p])
+                except (TypeError, ValueError):
+                    self.Notices['baud'] = 'Baud Rate must be a number.'
+            elif 'Time Sync' in p:
+                try:
+                    self.timesync.interval = float(self.Parameters[p])
+                except (TypeError, ValueError):
+                    self.Notices['timesync'] = 'Time Sync must be the number of hours between clock updates.'
+            elif 'Time Stamps' in p:
+                self.timesync.timestamps = str(self.Parameters[p]).lower() in ('true', 'yes', '1')
+            elif 'Transport' in p:
+                kind = str(self.Parameters[p]).lower()
+                if kind in (it100.transport.TCP, it100.transport.UDP, it100.transport.SERIAL):
+                    self.transport = kind
+                elif self.Parameters[p]:
+                    self.Notices['transport'] = 'Transport must be tcp, udp or serial.'
             elif 'Port' in p:
-                if self.Parameters[p] is not '':
+                try:
+                    int(self.Parameters[p])
                     validPort = True
-                else:
-                    self.Notices['port'] = 'Serial network interface port must be set.'
+                except (TypeError, ValueError):
+                    if self.Parameters[p]:
+                        self.Notices['port'] = 'Port must be a number.'
+            elif 'Chatter Threshold' in p:
+                try:
+                    self.chatter.threshold = int(self.Parameters[p])
+                except (TypeError, ValueError):
+                    self.Notices['chatter'] = 'Chatter Threshold must be a number.'
+            elif 'Chatter Collapse' in p:
+                self.chatter_collapse = str(self.Parameters[p]).lower() in ('true', 'yes', '1')
+            elif 'Capture File' in p:
+                if self.Parameters[p]:
+                    self.capture_file = self.Parameters[p]
             elif 'Zone' in p:
                 self.zone_map[p] = self.Parameters[p]
 
-        if validIP and validPort:
-            self.connect()
+        if self.transport == it100.transport.SERIAL:
+            valid = validDevice
+            if not validDevice:
+                self.Notices['device'] = 'Serial Port must be set to the IT-100 serial device.'
+        else:
+            valid = validIP and validPort
+            if not validIP:
+                self.Notices['ip'] = 'IP Address of serial network interface must be set.'
+            if not validPort and 'port' not in self.Notices:
+                self.Notices['port'] = 'Serial network interface port must be set.'
+
+        if valid:
+            self._connect()
             # create nodes?
             self.discover()
 
             self.configured = True
+        else:
+            self._disconnect()
 
 
     """
       Connect to the DSC IT 100 
     """
-    def connect(self):
-        self.dsc = it100.DSCConnection(self.Parameters['IP Address'], self.Parameters['Port'])
+    def _connect(self):
+        # stop the old connection before starting a new one
+        self._disconnect()
+
+        link = it100.transport.create(self.transport,
+                address=self.Parameters['IP Address'],
+                port=self.Parameters['Port'],
+                device=self.Parameters['Serial Port'],
+                baud=self.baud)
+        self.dsc = it100.DSCConnection(link)
+
+        if self.capture_file is not None:
+            # only needed when capturing so don't load it at startup
+            import capture
+            try:
+                self.capture = capture.CaptureWriter(self.capture_file)
+                self.dsc.capture = self.capture
+                LOGGER.info('Capturing IT-100 traffic to ' + self.capture_file)
+            except OSError as e:
+                LOGGER.error('Failed to open capture file: ' + str(e))
+
         self.dsc.Connect()
+        if self.started:
+            self._listen()
+
+    """
+      Start the receive thread for the current connection and request
+      the panel status.  The thread only reads, everything it receives
+      is passed to the owner thread along with the connection it came
+      from so messages from an old connection can be dropped.
+    """
+    def _listen(self):
+        if not self.dsc.connected:
+            return
+
+        conn = self.dsc
+        self.mesg_thread = threading.Thread(target=conn.Loop, name='dsc-receive',
+                args=(lambda msg: self.post(self._received, conn, msg),
+                      lambda: self.post(self._received, conn, None)))
+        self.mesg_thread.daemon = True
+        self.mesg_thread.start()
+
+        # status update
+        self.timesync.connected(self.dsc)
+        self.dsc.StatusRequest()
+        self.dsc.LabelRequest()
+
+    # msg of None marks the end of a receive
+    def _received(self, conn, msg):
+        if conn is not self.dsc:
+            return
+
+        if msg is None:
+            self.publish_troubles()
+        else:
+            self.processCommand(msg)
+
+    def _disconnect(self):
+        self.configured = False
+        if self.dsc is not None:
+            self.dsc.Close()
+        if self.mesg_thread is not None:
+            # the receive thread notices the close within the transport timeout
+            self.mesg_thread.join(it100.transport.TIMEOUT * 2)
+            if self.mesg_thread.is_alive():
+                LOGGER.warning('DSC receive thread did not stop')
+            self.mesg_thread = None
+        self.stop_capture()
+
+    def stop_capture(self):
+        if self.capture is not None:
+            self.capture.close()
+            self.capture = None
 
     def start(self):
         LOGGER.info('Starting node server')
         self.poly.setCustomParamsDoc()
         self.poly.updateProfile()
+        self.post(self._start)
 
-        while not self.configured:
-            time.sleep(5)
-
-        if self.dsc.connected:
-            # Start a thread that listens for messages from the russound.
-            self.mesg_thread = threading.Thread(target=self.dsc.Loop, args=(self.processCommand,))
-            self.mesg_thread.daemon = True
-            self.mesg_thread.start()
-
-            # status update
-            self.dsc.StatusRequest()
-            self.dsc.LabelRequest()
-
+    # If not configured yet, the connection is started when it is.
+    def _start(self):
+        self.started = True
+        if self.configured and self.dsc.connected:
+            self._listen()
             LOGGER.info('Node server started')
         else:
             LOGGER.info('Waiting for configuration to be complete')
 
     def poll(self, polltype):
+        self.post(self._poll, polltype)
+
+    def _poll(self, polltype):
         if 'longPoll' in polltype:
+            if self.dsc is not None and self.dsc.connected:
+                self.timesync.poll(self.dsc)
             return
 
         """
@@ -114,16 +310,97 @@ class Controller(udi_interface.Node):
             return
         """
 
-        # Attempt to restart network connect if it drops
-        if self.mesg_thread is not None and not self.mesg_thread.is_alive():
+        # Attempt to restart network connect if it drops or the
+        # first connect failed
+        if self.started and self.configured and (self.mesg_thread is None or not self.mesg_thread.is_alive()):
             LOGGER.info('DSC thread has stopped, restarting....')
             self.dsc.Close()
+            self.mesg_thread = None
             self.dsc.Connect()
-            self.mesg_thread = threading.Thread(target=self.dsc.Loop, args=(self.processCommand,))
-            self.mesg_thread.daemon = True
-            self.mesg_thread.start()
+            self._listen()
+
+        self.chatter_report()
+
+    """
+      Update the chatter flag and rate on the zone nodes.  For zones
+      that are being collapsed, publish the last state seen.
+    """
+    def chatter_report(self):
+        for z in range(1, self.chatter.zones + 1):
+            if self.chatter.update(z) and not self.chatter.is_chattering(z):
+                LOGGER.warning('Zone {} has stopped chattering'.format(z))
+
+            znode = self.poly.getNode('zone_' + str(z))
+            if not znode:
+                continue
+
+            znode.set_chatter(self.chatter.is_chattering(z))
+            znode.set_rate(self.chatter.rate(z))
+
+            if z in self.zone_state:
+                znode.set_state(self.zone_state.pop(z))
+
+    """
+      Zone open/restore.  If collapse is enabled, the state of a
+      chattering zone is only published from poll.
+    """
+    def zone_transition(self, zone, state):
+        if self.chatter.record(zone) and self.chatter.is_chattering(zone):
+            LOGGER.warning('Zone {} is chattering, check the sensor'.format(zone))
+
+        if self.chatter_collapse and self.chatter.is_chattering(zone):
+            LOGGER.debug('   zone {} {} (collapsed)'.format(zone, 'open' if state else 'closed'))
+            self.zone_state[zone] = state
+            return
+
+        LOGGER.warning('   zone {} {}{}'.format(zone, 'open' if state else 'closed', self.at()))
+        self.zone_state.pop(zone, None)
+        znode = self.poly.getNode('zone_' + str(zone))
+        if znode:
+            znode.set_state(state)
+
+    """
+      Send all of the trouble changes from the last receive to Polyglot
+      in a single update.
+    """
+    def publish_troubles(self):
+        updates = []
+        for (scope, index, bits) in self.troubles.changes():
+            if scope == trouble.PANEL:
+                node = self
+                mapping = PANEL_TROUBLES
+            elif scope == trouble.ZONE:
+                node = self.poly.getNode('zone_' + str(index))
+                mapping = ZONE_TROUBLES
+            else:
+                # partitions don't have nodes, they're summarized on the panel
+                self.troubles.done(scope, index)
+                continue
+
+            # keep it until the zone's node is added
+            if not node:
+                continue
+
+            self.troubles.done(scope, index)
+
+            for (driver, bit) in mapping:
+                value = 1 if bits & bit else 0
+                if node.getDriver(driver) != value:
+                    node.setDriver(driver, value, False)
+                    updates.append({
+                        'address': node.address,
+                        'driver': driver,
+                        'value': str(value),
+                        'uom': next(d['uom'] for d in node.drivers if d['driver'] == driver),
+                        })
+
+        if updates:
+            self.poly.send({'set': updates}, 'status')
 
     def query(self):
+        self.post(self._query)
+
+    def _query(self):
         for node in self.nodes:
             self.nodes[node].reportDrivers()
 
@@ -147,47 +424,51 @@ class Controller(udi_interface.Node):
             except:
                 LOGGER.warning('Failed to delete node ' + addr)
 
-            LOGGER.error(node)
+            LOGGER.debug('Adding zone node ' + addr)
             self.poly.addNode(node)
 
+        # troubles for zones that didn't have a node yet
+        self.publish_troubles()
+
     # Delete the node server from Polyglot
     def delete(self):
         LOGGER.info('Removing node server')
-        self.dsc.connected = False
-        self.dsc.Close()
+        self.post(self._stop, wait=True)
 
     def stop(self):
         LOGGER.info('Stopping node server')
-        self.dsc.connected = False
-        self.dsc.Close()
+        self.post(self._stop, wait=True)
+
+    def _stop(self):
+        self.started = False
+        self._disconnect()
 
 
+    # The panel time of the message being processed for log messages.
+    def at(self):
+        if self.event_time is None:
+            return ''
+        return ' at {}'.format(self.event_time)
+
     def processCommand(self, msg):
+        # panel time of the event, if the IT-100 is time stamping messages
+        self.event_time = self.timesync.event_time(msg) if msg.timestamp else None
+
         if msg.command == protocol.MSG_ZONE_OPEN:
-            zone = int(msg.data.decode())
-            zone_addr = 'zone_' + str(zone)
-            LOGGER.warning('   zone {} open'.format(zone))
-            znode = self.poly.getNode(zone_addr)
-            if znode:
-                znode.set_state(1)
+            self.zone_transition(int(msg.data.decode()), 1)
         elif msg.command == protocol.MSG_ZONE_RESTORED:
-            zone = int(msg.data.decode())
-            zone_addr = 'zone_' + str(zone)
-            LOGGER.warning('   zone {} closed'.format(zone))
-            znode = self.poly.getNode(zone_addr)
-            if znode:
-                znode.set_state(0)
+            self.zone_transition(int(msg.data.decode()), 0)
         elif msg.command == protocol.MSG_ZONE_ALARM:
             zone = int(msg.data[:-3].decode())
             zone_addr = 'zone_' + str(zone)
-            LOGGER.warning('   zone {} in alarm'.format(zone))
+            LOGGER.warning('   zone {} in alarm{}'.format(zone, self.at()))
             znode = self.poly.getNode(zone_addr)
             if znode:
                 znode.set_state(3)
         elif msg.command == protocol.MSG_ZONE_ALARM_RESTORE:
             zone = int(msg.data[:-3].decode())
             zone_addr = 'zone_' + str(zone)
-            LOGGER.warning('   zone {} alarm restore'.format(zone))
+            LOGGER.warning('   zone {} alarm restore{}'.format(zone, self.at()))
             znode = self.poly.getNode(zone_addr)
             if znode:
                 znode.set_state(0)
@@ -197,38 +478,18 @@ class Controller(udi_interface.Node):
             LOGGER.warning('   message = ' + str(msg.data[5:].decode()))
         elif msg.command == protocol.MSG_ACK:
             LOGGER.debug('Ack')
-        elif msg.command == protocol.MSG_SYSTEM_BELL_TROUBLE:
-            self.setDriver('GV1', 1)
-        elif msg.command == protocol.MSG_SYSTEM_BELL_RESTORED:
-            self.setDriver('GV1', 0)
-        elif msg.command == protocol.MSG_PANEL_BATTERY_TROUBLE:
-            self.setDriver('GV2', 1)
-        elif msg.command == protocol.MSG_PANEL_BATTERY_RESTORED:
-            self.setDriver('GV2', 0)
-        elif msg.command == protocol.MSG_PANEL_AC_TROUBLE:
-            self.setDriver('GV3', 1)
-        elif msg.command == protocol.MSG_PANEL_AC_RESTORED:
-            self.setDriver('GV3', 0)
-        elif msg.command == protocol.MSG_FTC_TROUBLE:
-            self.setDriver('GV4', 1)
-        elif msg.command == protocol.MSG_FTC_RESTORED:
-            self.setDriver('GV4', 0)
-        elif msg.command == protocol.MSG_GENERAL_SYSTEM_TAMPER:
-            self.setDriver('GV5', 1)
-        elif msg.command == protocol.MSG_GENERAL_SYSTEM_TAMPER_RESTORED:
-            self.setDriver('GV5', 0)
+        elif msg.command in trouble.CODES:
+            # published from publish_troubles() after the receive
+            self.troubles.apply(msg.command, msg.data, self.event_time)
         elif msg.command == protocol.MSG_PARTITION_READY:
             partition = int(msg.data.decode())
-            LOGGER.warning('  partition {} ready'.format(partition))
+            LOGGER.warning('  partition {} ready{}'.format(partition, self.at()))
         elif msg.command == protocol.MSG_PARTITION_NOT_READY:
             partition = int(msg.data.decode())
-            LOGGER.warning('  partition {} not ready'.format(partition))
+            LOGGER.warning('  partition {} not ready{}'.format(partition, self.at()))
         elif msg.command == protocol.MSG_PARTITION_BUSY:
             partition = int(msg.data.decode())
-            LOGGER.warning('  partition {} busy'.format(partition))
-        elif msg.command == protocol.MSG_PARTITION_TROUBLE_RESTORED:
-            partition = int(msg.data.decode())
-            LOGGER.warning('  partition {} trouble restored'.format(partition))
+            LOGGER.warning('  partition {} busy{}'.format(partition, self.at()))
         elif msg.command == protocol.MSG_LED_STATUS:
             led = {
                 0x31:'Ready',
@@ -251,6 +512,15 @@ class Controller(udi_interface.Node):
             zone = int(msg.data[0:3].decode())
             label = msg.data[3:].decode()
             LOGGER.warning('Label: {} = {}'.format(zone, label))
+        elif msg.command == protocol.MSG_TIME_DATE_BCAST:
+            panel = self.timesync.broadcast(msg.data)
+            # Only compare with our clock when talking to a live panel, a
+            # replayed broadcast is from some other time.
+            if panel is not None and self.dsc is not None and self.dsc.connected:
+                self.timesync.check_drift(panel)
+                if self.timesync.needs_set():
+                    LOGGER.warning('Panel clock is off by {:.0f} seconds'.format(self.timesync.drift))
+                    self.timesync.set_clock(self.dsc)
         else:
             LOGGER.warning('command = {}'.format(msg.command))
             LOGGER.warning('   data = ' + ' '.join('{:02x}'.format(x) for x in msg.data))
@@ -264,10 +534,14 @@ class Controller(udi_interface.Node):
     # controller node.
     drivers = [
             {'driver': 'ST', 'value': 1, 'uom': 2},   # node server status
-            {'driver': 'GV1', 'value': 0, 'uom': 25},  # system bell status
-            {'driver': 'GV2', 'value': 0, 'uom': 25},  # panel battery status
-            {'driver': 'GV3', 'value': 0, 'uom': 25},  # panel AC status
-            {'driver': 'GV4', 'value': 0, 'uom': 25},  # FTC status
-            {'driver': 'GV5', 'value': 0, 'uom': 25},  # General status
+            {'driver': 'GV1', 'value': 0, 'uom': 2},   # system bell status
+            {'driver': 'GV2', 'value': 0, 'uom': 2},   # panel battery status
+            {'driver': 'GV3', 'value': 0, 'uom': 2},   # panel AC status
+            {'driver': 'GV4', 'value': 0, 'uom': 2},   # FTC status
+            {'driver': 'GV5', 'value': 0, 'uom': 2},   # General status
+            {'driver': 'GV6', 'value': 0, 'uom': 2},   # device low battery
+            {'driver': 'GV7', 'value': 0, 'uom': 2},   # fire trouble
+            {'driver': 'GV8', 'value': 0, 'uom': 2},   # keybus fault
+            {'driver': 'GV9', 'value': 0, 'uom': 2},   # partition trouble
             ]
 
@@ -2,9 +2,6 @@
 # 
 
 import udi_interface
-import json
-import time
-import datetime
 
 LOGGER = udi_interface.LOGGER
 
@@ -15,6 +12,11 @@ class Zone(udi_interface.Node):
     drivers = [
             {'driver': 'ST', 'value': 0, 'uom': 25},       # zone status
             {'driver': 'GV0', 'value': 0, 'uom': 25},      # zone bypass
+            {'driver': 'GV1', 'value': 0, 'uom': 2},       # zone chatter
+            {'driver': 'GV2', 'value': 0, 'uom': 56},      # transitions/window
+            {'driver': 'GV3', 'value': 0, 'uom': 2},       # zone tamper
+            {'driver': 'GV4', 'value': 0, 'uom': 2},       # zone fault
+            {'driver': 'GV5', 'value': 0, 'uom': 2},       # low battery
             ]
 
 
@@ -24,6 +26,12 @@ class Zone(udi_interface.Node):
     def set_bypass(self, source):
         self.setDriver('GV0', source + 1, True, True, 25)
 
+    def set_chatter(self, chatter):
+        self.setDriver('GV1', 1 if chatter else 0, True, False, 2)
+
+    def set_rate(self, rate):
+        self.setDriver('GV2', rate, True, False, 56)
+
     def process_cmd(self, cmd=None):
         # {'address': 'zone_2', 'cmd': 'VOLUME', 'value': '28', 'uom': '56', 'query': {}}
 
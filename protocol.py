@@ -91,9 +91,10 @@ MSG_VERSION = b'908'
 _LOGGER = logging.getLogger(__name__)
 
 class DSCMessage():
-    def __init__(self, command, data=''):
+    def __init__(self, command, data='', timestamp=None):
         self.command = command
         self.data = data
+        self.timestamp = timestamp   # 'hh:mm:ss' when time stamps are on
 
     def checksum(self):
         cksum = 0
@@ -109,11 +110,17 @@ class DSCMessage():
 
     @classmethod
     def deserialize(cls, rawdata):
+        # with time stamp control on, messages start with 'hh:mm:ss '
+        timestamp = None
+        if len(rawdata) > 9 and rawdata[2:3] == b':' and rawdata[5:6] == b':' and rawdata[8:9] == b' ':
+            timestamp = bytes(rawdata[0:8]).decode()
+            rawdata = rawdata[9:]
+
         command = rawdata[0:3]
         data = rawdata[3:-4]
         checksum = rawdata[-4:-2]
 
-        message = cls(command, data)
+        message = cls(command, data, timestamp)
 
         if message.checksum() != checksum:
             print('checksum failed')
@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+"""
+Replay a captured IT-100 session against the node server's controller
+Copyright (C) 2020,2021 Robert Paauwe
+
+usage: replay.py [-r] [-p poll] [-z zones] [-e expected.json] [-v] capture_file
+       replay.py --stress seconds capture_file
+
+The controller runs against a stub of udi_interface so no Polyglot or
+ISY is needed.  When the replay is done, the driver values of the
+controller and zone nodes are printed.  If an expected state file is
+given, it is a JSON object of {address: {driver: value}} and the exit
+status is non-zero if any driver doesn't match.
+
+With --stress, the capture is served over TCP by a local simulator
+and the controller is connected to it while parameter changes and
+polls are fired at it from other threads.  The exit status is non-zero
+if anything was logged as an error or a receive thread was left running.
+tests/test_controller.py runs the same stress with generated traffic.
+"""
+
+import argparse
+import json
+import logging
+import random
+import socket
+import sys
+import threading
+import time
+import types
+
+"""
+    Minimal stand-in for udi_interface.  Only what the node server uses
+    is provided.
+"""
+class StubNode(object):
+    def __init__(self, poly, primary, address, name):
+        self.poly = poly
+        self.primary = primary
+        self.address = address
+        self.name = name
+        self.drivers = [dict(d) for d in type(self).drivers]
+
+    def setDriver(self, driver, value, report=True, force=False, uom=None, text=None):
+        for d in self.drivers:
+            if d['driver'] == driver:
+                changed = d['value'] != value
+                d['value'] = value
+                if uom is not None:
+                    d['uom'] = uom
+                if report and (changed or force):
+                    self.poly.send({'set': [{'address': self.address, 'driver': driver, 'value': str(value), 'uom': d['uom']}]}, 'status')
+                return changed
+
+    def getDriver(self, driver):
+        for d in self.drivers:
+            if d['driver'] == driver:
+                return d['value']
+        return None
+
+    def reportDrivers(self):
+        self.poly.send({'set': [dict(d, address=self.address) for d in self.drivers]}, 'status')
+
+    def delNode(self, address):
+        self.poly.delNode(address)
+
+class StubCustom(dict):
+    def __init__(self, poly, custom):
+        super(StubCustom, self).__init__()
+
+    def load(self, data):
+        self.clear()
+        self.update(data)
+
+    def __getitem__(self, key):
+        return self.get(key)
+
+class StubInterface(object):
+    CUSTOMPARAMS = 'customparams'
+    START = 'start'
+    POLL = 'poll'
+
+    def __init__(self, *args):
+        self.nodes = {}
+        self.sent = 0
+
+    def subscribe(self, topic, callback, address=None):
+        pass
+
+    def ready(self):
+        pass
+
+    def addNode(self, node):
+        self.nodes[node.address] = node
+
+    def delNode(self, address):
+        self.nodes.pop(address, None)
+
+    def getNode(self, address):
+        return self.nodes.get(address)
+
+    def send(self, message, type):
+        self.sent += 1
+
+    def setCustomParamsDoc(self):
+        pass
+
+    def updateProfile(self):
+        pass
+
+def install_stub():
+    stub = types.ModuleType('udi_interface')
+    stub.LOGGER = logging.getLogger('udi_interface')
+    stub.Node = StubNode
+    stub.Custom = StubCustom
+    stub.Interface = StubInterface
+    sys.modules['udi_interface'] = stub
+    return stub
+
+def build_controller(zones=64):
+    install_stub()
+    from nodes import dsc
+    from nodes import zone
+
+    poly = StubInterface()
+    controller = dsc.Controller(poly, 'controller', 'controller', 'DSC')
+    for z in range(1, zones + 1):
+        addr = 'zone_' + str(z)
+        poly.addNode(zone.Zone(poly, 'controller', addr, 'Zone ' + str(z)))
+    return (poly, controller)
+
+# Short polls are run every 'poll' seconds of capture time and once
+# at the end so state that is only published from poll is included.
+def replay(path, controller, realtime=False, poll=5):
+    import capture
+    import it100
+
+    parser = it100.FrameParser()
+    frames = 0
+    next_poll = poll
+    start = time.monotonic()
+    for (t, data) in capture.read_capture(path):
+        if realtime:
+            delay = t - (time.monotonic() - start)
+            if delay > 0:
+                time.sleep(delay)
+        while poll > 0 and t >= next_poll:
+            controller.poll('shortPoll')
+            next_poll += poll
+        # same order the receive thread would post them in
+        for message in parser.feed(data):
+            controller.post(controller.processCommand, message)
+            frames += 1
+        controller.post(controller.publish_troubles)
+
+    controller.poll('shortPoll')
+    controller.sync()
+    return (frames, time.monotonic() - start)
+
+"""
+    Serve the capture data to every client that connects, over and over,
+    in random sized pieces.  data can be replaced while running, clients
+    switch to it at the end of the current pass.
+"""
+class Simulator:
+    def __init__(self, data):
+        self.data = data
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(5)
+        self.port = self.sock.getsockname()[1]
+        self.running = True
+        self.connections = 0
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while self.running:
+            try:
+                (conn, addr) = self.sock.accept()
+            except OSError:
+                return
+            self.connections += 1
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        conn.settimeout(0)
+        try:
+            while self.running:
+                data = self.data
+                i = 0
+                while i < len(data) and self.running:
+                    n = random.randint(1, 64)
+                    conn.sendall(data[i:i + n])
+                    i += n
+                    try:
+                        conn.recv(1024)   # discard requests from the node server
+                    except BlockingIOError:
+                        pass
+                    time.sleep(0.001)
+        except OSError:
+            pass
+        finally:
+            conn.close()
+
+    def close(self):
+        self.running = False
+        self.sock.close()
+
+"""
+    Collect everything logged at ERROR or above, from any module, and
+    any exception that ends a thread.
+"""
+class ErrorCounter(logging.Handler):
+    def __init__(self):
+        super(ErrorCounter, self).__init__(logging.ERROR)
+        self.errors = []
+
+    def emit(self, record):
+        self.errors.append(self.format(record))
+
+    def install(self):
+        log = logging.getLogger()
+        log.addHandler(self)
+        if log.getEffectiveLevel() > logging.ERROR:
+            log.setLevel(logging.ERROR)
+        self.excepthook = threading.excepthook
+        threading.excepthook = lambda args: self.errors.append(
+                '{} in thread {}'.format(repr(args.exc_value), args.thread.name if args.thread else '?'))
+
+    def remove(self):
+        logging.getLogger().removeHandler(self)
+        threading.excepthook = self.excepthook
+
+def receivers():
+    return [t for t in threading.enumerate() if t.name == 'dsc-receive' and t.is_alive()]
+
+"""
+    Fire parameter changes and polls at the controller from other threads
+    for 'seconds' while it is connected to the simulator on 'port'.
+"""
+def load(controller, port, seconds):
+    end = time.monotonic() + seconds
+    counts = {'params': 0, 'polls': 0}
+
+    def params():
+        while time.monotonic() < end:
+            controller.parameterHandler({
+                'IP Address': '127.0.0.1',
+                'Port': str(port),
+                'Chatter Threshold': str(random.randint(0, 20)),
+                'Chatter Collapse': random.choice(['true', 'false']),
+                'Zone 1': 'Zone One',
+                })
+            counts['params'] += 1
+            time.sleep(random.uniform(0, 0.2))
+
+    def polls():
+        while time.monotonic() < end:
+            controller.poll(random.choice(['shortPoll', 'shortPoll', 'longPoll']))
+            counts['polls'] += 1
+            time.sleep(random.uniform(0, 0.02))
+
+    workers = [threading.Thread(target=params), threading.Thread(target=polls), threading.Thread(target=polls)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return counts
+
+def stress(path, seconds, zones):
+    import capture
+
+    data = b''.join(d for (t, d) in capture.read_capture(path))
+    sim = Simulator(data)
+
+    counter = ErrorCounter()
+    counter.install()
+
+    (poly, controller) = build_controller(zones)
+    controller.start()
+    counts = load(controller, sim.port, seconds)
+
+    controller.stop()
+    controller.sync()
+    sim.close()
+    counter.remove()
+
+    left = receivers()
+
+    print('{} parameter changes, {} polls, {} connections, {} driver updates'.format(
+        counts['params'], counts['polls'], sim.connections, poly.sent))
+    for e in counter.errors:
+        print('ERROR ' + e)
+    if left:
+        print('ERROR {} receive threads still running'.format(len(left)))
+
+    return not (counter.errors or left)
+
+def node_states(poly):
+    states = {}
+    for addr in poly.nodes:
+        node = poly.nodes[addr]
+        states[addr] = {d['driver']: d['value'] for d in node.drivers}
+    return states
+
+def compare(states, expected):
+    errors = []
+    for addr in expected:
+        if addr not in states:
+            errors.append('{}: no such node'.format(addr))
+            continue
+        for driver in expected[addr]:
+            value = states[addr].get(driver)
+            if value != expected[addr][driver]:
+                errors.append('{} {}: expected {} got {}'.format(addr, driver, expected[addr][driver], value))
+    return errors
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description='Replay a captured IT-100 session.')
+    ap.add_argument('capture', help='capture file recorded by the node server')
+    ap.add_argument('-r', '--realtime', action='store_true', help='replay at the recorded speed')
+    ap.add_argument('-e', '--expect', help='JSON file with expected driver values')
+    ap.add_argument('-p', '--poll', type=float, default=5, help='short poll interval in seconds of capture time')
+    ap.add_argument('-z', '--zones', type=int, default=64, help='number of zone nodes to create')
+    ap.add_argument('-s', '--stress', type=float, help='run the stress test for this many seconds')
+    ap.add_argument('-v', '--verbose', action='store_true', help='show node server logging')
+    args = ap.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.CRITICAL)
+
+    if args.stress:
+        sys.exit(0 if stress(args.capture, args.stress, args.zones) else 1)
+
+    (poly, controller) = build_controller(args.zones)
+    (frames, elapsed) = replay(args.capture, controller, args.realtime, args.poll)
+    states = node_states(poly)
+
+    print('{} messages in {:.3f} seconds, {} driver updates'.format(frames, elapsed, poly.sent))
+    for addr in states:
+        print('{:12} {}'.format(addr, ' '.join('{}={}'.format(d, v) for d, v in states[addr].items())))
+
+    if args.expect:
+        with open(args.expect) as fp:
+            errors = compare(states, json.load(fp))
+        for e in errors:
+            print('MISMATCH ' + e)
+        sys.exit(1 if errors else 0)
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Measure the import time of the node server at startup
+Copyright (C) 2020,2021 Robert Paauwe
+
+usage: startup_profile.py [-b budget_ms] [-r runs] [-t top]
+
+Imports the node server's controller module in a fresh interpreter with
+'-X importtime' and reports where the time goes.  The time spent in the
+node server's own modules is checked against the budget and modules
+that should only be loaded on first use are checked to make sure they
+weren't loaded.  The exit status is non-zero if either check fails.
+Import times vary from run to run so the fastest of several runs is used.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+ENTRY = 'nodes.dsc'
+
+# Modules that belong to the node server.
+LOCAL = ('protocol', 'it100', 'chatter', 'trouble', 'timesync', 'capture', 'node_funcs', 'nodes')
+
+# Modules that must not be imported when the node server starts.
+LAZY = ('capture', 'replay', 'node_funcs', 'startup_profile')
+
+DEFAULT_BUDGET = 10.0   # milliseconds
+
+def measure(entry=ENTRY):
+    here = os.path.dirname(os.path.abspath(__file__))
+    # Print the modules loaded by the entry point itself, not the ones
+    # the interpreter had already loaded on startup.
+    code = 'import sys; pre = set(sys.modules); import {}; print(" ".join(set(sys.modules) - pre))'.format(entry)
+    # Let it write byte code like the node server does, otherwise every
+    # run measures compiling any module that changed since it was
+    # last cached.
+    env = dict(os.environ)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+            cwd=here, env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        sys.stderr.write(proc.stderr)
+        raise SystemExit('Failed to import ' + entry)
+
+    times = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        (self_us, cumulative_us, name) = line[len('import time:'):].split('|')
+        times.append((name.strip(), int(self_us), int(cumulative_us)))
+
+    return (times, set(proc.stdout.split()))
+
+def is_local(name):
+    return name.split('.')[0] in LOCAL
+
+"""
+    Measure 'runs' times and return (local_ms, times, loaded) for the
+    run where the node server's own modules were fastest.
+"""
+def best_of(runs, entry=ENTRY):
+    best = None
+    for run in range(max(runs, 1)):
+        (times, loaded) = measure(entry)
+        local = sum(t[1] for t in times if is_local(t[0])) / 1000.0
+        if best is None or local < best[0]:
+            best = (local, times, loaded)
+    return best
+
+# Modules from LAZY that were loaded.
+def eager_modules(loaded):
+    return sorted(m for m in loaded if m.split('.')[0] in LAZY)
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description='Check the node server import time.')
+    ap.add_argument('-b', '--budget', type=float, default=DEFAULT_BUDGET,
+            help='milliseconds allowed for the node server\'s own modules')
+    ap.add_argument('-r', '--runs', type=int, default=3, help='number of times to measure')
+    ap.add_argument('-t', '--top', type=int, default=15, help='number of modules to list')
+    args = ap.parse_args()
+
+    (local, times, loaded) = best_of(args.runs)
+    total = sum(t[1] for t in times) / 1000.0
+
+    print('Slowest imports (self time):')
+    for (name, self_us, cumulative_us) in sorted(times, key=lambda t: t[1], reverse=True)[:args.top]:
+        print('  {:8.2f} ms {:8.2f} ms  {}'.format(self_us / 1000.0, cumulative_us / 1000.0, name))
+
+    print('Total import time  {:8.2f} ms'.format(total))
+    print('Node server        {:8.2f} ms (budget {:.2f} ms)'.format(local, args.budget))
+
+    failed = False
+    if local > args.budget:
+        print('FAIL: node server imports are over budget')
+        failed = True
+
+    eager = eager_modules(loaded)
+    if eager:
+        print('FAIL: loaded at startup: ' + ', '.join(eager))
+        failed = True
+
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,98 @@
+#
+#  Tests for capture files and replaying them against the controller.
+
+import pytest
+
+import capture
+import protocol
+import replay
+
+
+def frame(command, data=b''):
+    return protocol.DSCMessage(command, data).serialize()
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / 'session.cap')
+
+    # two connections, each appends a block
+    w = capture.CaptureWriter(path)
+    w.write(frame(protocol.MSG_ZONE_OPEN, b'001'))
+    w.write(frame(protocol.MSG_PANEL_AC_TROUBLE))
+    w.close()
+    w.write(b'dropped after close')
+
+    w = capture.CaptureWriter(path)
+    w.write(frame(protocol.MSG_ZONE_OPEN, b'002'))
+    w.write(frame(protocol.MSG_ZONE_RESTORED, b'001'))
+    w.close()
+
+    # a record cut off by a crash
+    with open(path, 'ab') as fp:
+        fp.write(capture.RECORD.pack(5, 20) + b'609')
+
+    records = list(capture.read_capture(path))
+    assert [d for (t, d) in records] == [
+            frame(protocol.MSG_ZONE_OPEN, b'001'),
+            frame(protocol.MSG_PANEL_AC_TROUBLE),
+            frame(protocol.MSG_ZONE_OPEN, b'002'),
+            frame(protocol.MSG_ZONE_RESTORED, b'001'),
+            ]
+    times = [t for (t, d) in records]
+    assert times == sorted(times)
+
+    (poly, controller) = replay.build_controller(3)
+    try:
+        (frames, elapsed) = replay.replay(path, controller)
+        assert frames == 4
+        assert replay.compare(replay.node_states(poly), {
+                'controller': {'GV3': 1},
+                'zone_1': {'ST': 0},
+                'zone_2': {'ST': 1},
+                'zone_3': {'ST': 0},
+                }) == []
+        assert replay.compare(replay.node_states(poly), {'zone_2': {'ST': 0}, 'zone_9': {}}) == [
+                'zone_2 ST: expected 0 got 1',
+                'zone_9: no such node',
+                ]
+    finally:
+        controller.stop()
+
+
+def test_time_wrap(tmp_path):
+    path = str(tmp_path / 'long.cap')
+
+    w = capture.CaptureWriter(path)
+    w.write(b'first')
+    # a connection that has been up longer than the time field holds
+    w.start -= (capture.MAX_TIME + 1000) / 1000.0
+    w.write(b'second')
+    w.write(b'third')
+    w.close()
+
+    with open(path, 'rb') as fp:
+        assert fp.read().count(capture.MAGIC) == 2
+
+    records = list(capture.read_capture(path))
+    assert [d for (t, d) in records] == [b'first', b'second', b'third']
+    times = [t for (t, d) in records]
+    assert times == sorted(times)
+
+
+def test_large_write(tmp_path):
+    path = str(tmp_path / 'large.cap')
+    data = bytes(range(256)) * 300
+    w = capture.CaptureWriter(path)
+    w.write(data)
+    w.close()
+
+    records = list(capture.read_capture(path))
+    assert len(records) == 2
+    assert b''.join(d for (t, d) in records) == data
+
+
+def test_not_a_capture(tmp_path):
+    path = tmp_path / 'other.bin'
+    path.write_bytes(b'not a capture file')
+    with pytest.raises(ValueError):
+        list(capture.read_capture(str(path)))
@@ -0,0 +1,112 @@
+#
+#  Tests for zone chatter detection.  Times are passed in so the
+#  sliding window can be tested without waiting.
+
+import chatter
+
+# 12 buckets of 5 minutes
+WINDOW = 3600
+BUCKET = 300
+
+
+def monitor(threshold=10):
+    return chatter.ChatterMonitor(threshold=threshold, window=WINDOW, buckets=12, zones=8)
+
+
+def test_flag_at_threshold():
+    m = monitor()
+    for i in range(10):
+        assert not m.record(1, now=i)
+    assert m.rate(1) == 10
+    assert not m.is_chattering(1)
+
+    # over the threshold
+    assert m.record(1, now=10)
+    assert m.is_chattering(1)
+    # already flagged, no change
+    assert not m.record(1, now=11)
+
+
+def test_clear_at_half():
+    m = monitor()
+    for i in range(11):
+        m.record(1, now=BUCKET * (i // 2))
+    assert m.is_chattering(1)
+
+    # counts from the first buckets age out of the window, the flag
+    # stays until the rate is down to half the threshold
+    cleared = None
+    for b in range(12, 20):
+        if m.update(1, now=BUCKET * b):
+            cleared = b
+            break
+    assert cleared is not None
+    assert not m.is_chattering(1)
+    assert m.rate(1) <= 10 // 2
+
+    # and isn't set again until it goes over the full threshold
+    for i in range(5):
+        m.record(1, now=BUCKET * cleared + i)
+    assert m.rate(1) <= 10
+    assert not m.is_chattering(1)
+
+
+def test_bucket_expiry():
+    m = monitor()
+    m.record(2, now=0)
+    m.record(2, now=BUCKET)
+    m.record(2, now=BUCKET * 2)
+    assert m.rate(2) == 3
+
+    # the bucket at 0 leaves the window when bucket 12 starts
+    m.update(2, now=BUCKET * 12)
+    assert m.rate(2) == 2
+    m.update(2, now=BUCKET * 13)
+    assert m.rate(2) == 1
+    m.update(2, now=BUCKET * 14)
+    assert m.rate(2) == 0
+
+
+def test_window_reset():
+    m = monitor()
+    for i in range(11):
+        m.record(3, now=BUCKET * 5 + i)
+    assert m.is_chattering(3)
+
+    # quiet for longer than the whole window
+    assert m.update(3, now=BUCKET * 5 + WINDOW * 3)
+    assert m.rate(3) == 0
+    assert not m.is_chattering(3)
+    assert sum(m.counts[3 * m.buckets:4 * m.buckets]) == 0
+
+    m.record(3, now=BUCKET * 5 + WINDOW * 3)
+    assert m.rate(3) == 1
+
+
+def test_zones_independent():
+    m = monitor()
+    for i in range(11):
+        m.record(4, now=i)
+    m.record(5, now=11)
+    assert m.is_chattering(4)
+    assert not m.is_chattering(5)
+    assert m.rate(5) == 1
+
+
+def test_threshold_off():
+    m = monitor(threshold=0)
+    for i in range(100):
+        assert not m.record(1, now=i)
+    assert not m.is_chattering(1)
+    assert m.rate(1) == 100
+
+
+def test_invalid_zone():
+    m = monitor()
+    for zone in (0, 9, -1):
+        assert not m.valid(zone)
+        assert not m.record(zone, now=0)
+        assert not m.update(zone, now=0)
+        assert m.rate(zone) == 0
+        assert not m.is_chattering(zone)
+    assert m.totals == [0] * 9
@@ -0,0 +1,90 @@
+#
+#  Stress test for the controller.  It is connected to a simulated
+#  IT-100 while parameter changes, polls and panel traffic all arrive
+#  at the same time.
+
+import threading
+import time
+
+import protocol
+import replay
+
+
+def traffic(messages):
+    return b''.join(protocol.DSCMessage(c, d).serialize() for (c, d) in messages)
+
+# Zones going back and forth and troubles coming and going, a lot of
+# changes for the controller to keep up with.
+BUSY = traffic([
+        (protocol.MSG_ZONE_OPEN, b'001'),
+        (protocol.MSG_ZONE_OPEN, b'002'),
+        (protocol.MSG_PANEL_AC_TROUBLE, b''),
+        (protocol.MSG_ZONE_RESTORED, b'001'),
+        (protocol.MSG_ZONE_FAULT, b'004'),
+        (protocol.MSG_ZONE_RESTORED, b'002'),
+        (protocol.MSG_PANEL_AC_RESTORED, b''),
+        (protocol.MSG_ZONE_FAULT_RESTORE, b'004'),
+        (protocol.MSG_PARTITION_TROUBLE, b'1'),
+        (protocol.MSG_PARTITION_TROUBLE_RESTORED, b'1'),
+        (protocol.MSG_ZONE_OPEN, b'003'),
+        (protocol.MSG_ZONE_RESTORED, b'003'),
+        ])
+
+# Sent over and over once the stress is over, the state it leaves is
+# known.  Everything BUSY changes is set here, troubles are remembered
+# across connections so a pass cut short would otherwise leave them.
+FINAL = traffic([
+        (protocol.MSG_ZONE_RESTORED, b'001'),
+        (protocol.MSG_ZONE_OPEN, b'002'),
+        (protocol.MSG_ZONE_RESTORED, b'003'),
+        (protocol.MSG_ZONE_FAULT, b'004'),
+        (protocol.MSG_PANEL_AC_TROUBLE, b''),
+        (protocol.MSG_PARTITION_TROUBLE_RESTORED, b'1'),
+        ])
+
+EXPECTED = {
+        'controller': {'ST': 1, 'GV3': 1, 'GV9': 0},
+        'zone_1': {'ST': 0, 'GV4': 0},
+        'zone_2': {'ST': 1, 'GV4': 0},
+        'zone_3': {'ST': 0, 'GV4': 0},
+        'zone_4': {'ST': 0, 'GV4': 1},
+        }
+
+
+def test_stress():
+    counter = replay.ErrorCounter()
+    counter.install()
+    sim = replay.Simulator(BUSY)
+    try:
+        (poly, controller) = replay.build_controller(4)
+        controller.start()
+
+        counts = replay.load(controller, sim.port, 3)
+        assert counts['params'] > 1
+        assert counts['polls'] > 1
+
+        # settle on the final traffic with chatter collapse off
+        sim.data = FINAL
+        controller.parameterHandler({'IP Address': '127.0.0.1', 'Port': str(sim.port)})
+        errors = ['no state']
+        for i in range(50):
+            time.sleep(0.1)
+            controller.poll('shortPoll')
+            controller.sync()
+            errors = replay.compare(replay.node_states(poly), EXPECTED)
+            if not errors:
+                break
+        assert errors == []
+        assert controller.configured
+        assert controller.dsc.connected
+
+        controller.stop()
+        controller.sync()
+    finally:
+        sim.close()
+        counter.remove()
+
+    assert counter.errors == []
+    assert replay.receivers() == []
+    assert controller.dsc.connected is False
+    assert sim.connections > 1
@@ -0,0 +1,18 @@
+#
+#  Tests for the node server's startup import time.
+
+import startup_profile
+
+
+def test_import_budget():
+    (local, times, loaded) = startup_profile.best_of(3)
+    assert times
+    assert local <= startup_profile.DEFAULT_BUDGET
+    assert startup_profile.eager_modules(loaded) == []
+    # the controller's own module is measured
+    assert any(name == 'nodes.dsc' for (name, self_us, cumulative_us) in times)
+
+
+def test_eager_modules():
+    loaded = {'protocol', 'nodes.dsc', 'capture', 'replay'}
+    assert startup_profile.eager_modules(loaded) == ['capture', 'replay']
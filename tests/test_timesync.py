@@ -0,0 +1,125 @@
+#
+#  Tests for the panel clock handling and time stamped messages.
+
+import datetime
+
+import protocol
+import timesync
+
+
+class FakeConnection:
+    def __init__(self):
+        self.sent = []
+
+    def Send(self, msg):
+        self.sent.append((msg.command, msg.data))
+
+
+def stamped(stamp):
+    return protocol.DSCMessage(protocol.MSG_ZONE_OPEN, b'001', stamp)
+
+
+def test_deserialize_timestamp():
+    frame = protocol.DSCMessage(protocol.MSG_ZONE_OPEN, b'001').serialize()
+
+    msg = protocol.DSCMessage.deserialize(b'23:59:58 ' + frame)
+    assert msg.timestamp == '23:59:58'
+    assert msg.command == protocol.MSG_ZONE_OPEN
+    assert msg.data == b'001'
+
+    msg = protocol.DSCMessage.deserialize(frame)
+    assert msg.timestamp is None
+    assert msg.command == protocol.MSG_ZONE_OPEN
+    assert msg.data == b'001'
+
+
+def test_event_time_same_day():
+    ts = timesync.TimeSync()
+    now = datetime.datetime(2026, 6, 1, 12, 0, 10)
+    assert ts.event_time(stamped('12:00:05'), now) == datetime.datetime(2026, 6, 1, 12, 0, 5)
+    # panel a little ahead of us
+    assert ts.event_time(stamped('12:00:15'), now) == datetime.datetime(2026, 6, 1, 12, 0, 15)
+
+
+def test_event_time_midnight():
+    ts = timesync.TimeSync()
+
+    # stamped before midnight, processed after
+    now = datetime.datetime(2026, 1, 2, 0, 0, 3)
+    assert ts.event_time(stamped('23:59:58'), now) == datetime.datetime(2026, 1, 1, 23, 59, 58)
+
+    # panel clock ahead, stamped after midnight before we get there
+    now = datetime.datetime(2026, 1, 1, 23, 59, 59)
+    assert ts.event_time(stamped('00:00:05'), now) == datetime.datetime(2026, 1, 2, 0, 0, 5)
+
+    # year end
+    now = datetime.datetime(2025, 12, 31, 23, 59, 59)
+    assert ts.event_time(stamped('00:00:01'), now) == datetime.datetime(2026, 1, 1, 0, 0, 1)
+
+
+def test_event_time_no_stamp():
+    ts = timesync.TimeSync()
+    now = datetime.datetime(2026, 6, 1, 12, 0, 0)
+    assert ts.event_time(stamped(None), now) == now
+    assert ts.event_time(stamped('25:00:00'), now) == now
+
+
+def test_broadcast():
+    ts = timesync.TimeSync()
+    assert ts.broadcast(b'1432061526') == datetime.datetime(2026, 6, 15, 14, 32)
+    assert ts.panel_time == datetime.datetime(2026, 6, 15, 14, 32)
+
+    assert ts.broadcast(b'9999999999') is None
+    assert ts.broadcast(b'') is None
+    # a bad one doesn't replace the last good time
+    assert ts.panel_time == datetime.datetime(2026, 6, 15, 14, 32)
+
+
+def test_needs_set():
+    ts = timesync.TimeSync()
+    panel = datetime.datetime(2026, 6, 15, 14, 32)
+
+    # nothing to compare with yet
+    assert not ts.needs_set()
+
+    ts.check_drift(panel, panel + datetime.timedelta(seconds=timesync.MAX_DRIFT))
+    assert ts.drift == timesync.MAX_DRIFT
+    assert not ts.needs_set()
+
+    ts.check_drift(panel, panel + datetime.timedelta(seconds=timesync.MAX_DRIFT + 1))
+    assert ts.needs_set()
+
+    # panel ahead of us
+    ts.check_drift(panel, panel - datetime.timedelta(seconds=timesync.MAX_DRIFT + 1))
+    assert ts.needs_set()
+
+    # clock setting turned off
+    ts.interval = 0
+    assert not ts.needs_set()
+
+
+def test_set_clock():
+    ts = timesync.TimeSync()
+    conn = FakeConnection()
+    ts.drift = 500
+
+    ts.set_clock(conn, datetime.datetime(2026, 6, 15, 14, 32, 45))
+    assert conn.sent == [(protocol.CMD_SET_TIME_DATE, b'1432061526')]
+    assert ts.drift is None
+    assert ts.last_set is not None
+    assert not ts.needs_set()
+
+
+def test_connected():
+    conn = FakeConnection()
+    timesync.TimeSync(timestamps=True).connected(conn)
+    assert conn.sent[0] == (protocol.CMD_TIME_DATE_BCAST_CONTROL, b'0')
+    assert conn.sent[1] == (protocol.CMD_TIME_STAMP_CONTROL, b'1')
+    assert conn.sent[2][0] == protocol.CMD_SET_TIME_DATE
+
+    conn = FakeConnection()
+    timesync.TimeSync(interval=0).connected(conn)
+    assert conn.sent == [
+            (protocol.CMD_TIME_DATE_BCAST_CONTROL, b'0'),
+            (protocol.CMD_TIME_STAMP_CONTROL, b'0'),
+            ]
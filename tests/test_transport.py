@@ -0,0 +1,257 @@
+#
+#  Tests for the IT-100 transports and the connection's receive loop.
+#  Everything runs against local sockets and a pseudo terminal so no
+#  IT-100 or serial/IP bridge is needed.
+
+import os
+import socket
+import threading
+
+import pytest
+
+import it100
+import protocol
+from it100 import transport
+
+
+def frame(command, data=b''):
+    return protocol.DSCMessage(command, data).serialize()
+
+# Read until 'size' bytes have arrived, recv() returns b'' on timeout.
+def recv_all(link, size):
+    data = b''
+    for i in range(20):
+        data += link.recv(size - len(data))
+        if len(data) >= size:
+            break
+    return data
+
+
+def test_create():
+    assert isinstance(transport.create('tcp', '127.0.0.1', '4999'), transport.TCPTransport)
+    assert isinstance(transport.create('UDP', '127.0.0.1', 4999), transport.UDPTransport)
+    assert isinstance(transport.create('serial', device='/dev/null', baud='19200'), transport.SerialTransport)
+    assert isinstance(transport.create(None, '127.0.0.1', 4999), transport.TCPTransport)
+    with pytest.raises(ValueError):
+        transport.create('usb')
+    with pytest.raises(ValueError):
+        transport.create('tcp', '127.0.0.1', 'abc')
+
+
+def test_serial():
+    pytest.importorskip('termios')
+    pty = pytest.importorskip('pty')
+
+    (master, slave) = pty.openpty()
+    try:
+        link = transport.SerialTransport(os.ttyname(slave), timeout=0.1)
+        link.open()
+
+        # nothing to read yet
+        assert link.recv(64) == b''
+
+        os.write(master, frame(protocol.MSG_ZONE_OPEN, b'001'))
+        assert recv_all(link, 10) == frame(protocol.MSG_ZONE_OPEN, b'001')
+
+        link.send(frame(protocol.CMD_STATUS_REQUEST))
+        assert os.read(master, 64) == frame(protocol.CMD_STATUS_REQUEST)
+
+        link.close()
+        with pytest.raises(ConnectionResetError):
+            link.recv(64)
+    finally:
+        os.close(master)
+        os.close(slave)
+
+
+def test_serial_bad_baud():
+    pytest.importorskip('termios')
+    link = transport.SerialTransport('/dev/null', baud=12345)
+    with pytest.raises(ValueError):
+        link.open()
+    assert link.fd is None
+
+
+def test_udp():
+    bridge = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    bridge.bind(('127.0.0.1', 0))
+    bridge.settimeout(5)
+    try:
+        link = transport.UDPTransport('127.0.0.1', bridge.getsockname()[1], timeout=0.1)
+        link.open()
+
+        assert link.recv(64) == b''
+
+        link.send(frame(protocol.CMD_STATUS_REQUEST))
+        (data, addr) = bridge.recvfrom(1024)
+        assert data == frame(protocol.CMD_STATUS_REQUEST)
+
+        # the whole datagram is returned even if it's more than asked for
+        bridge.sendto(frame(protocol.MSG_ZONE_OPEN, b'002'), addr)
+        assert link.recv(4) == frame(protocol.MSG_ZONE_OPEN, b'002')
+
+        link.close()
+        with pytest.raises(ConnectionResetError):
+            link.recv(64)
+    finally:
+        bridge.close()
+
+
+def test_tcp():
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(('127.0.0.1', 0))
+    server.listen(1)
+    try:
+        link = transport.TCPTransport('127.0.0.1', server.getsockname()[1], timeout=0.1)
+        link.open()
+        (peer, addr) = server.accept()
+        peer.settimeout(5)
+
+        assert link.recv(64) == b''
+
+        link.send(frame(protocol.CMD_STATUS_REQUEST))
+        assert peer.recv(1024) == frame(protocol.CMD_STATUS_REQUEST)
+
+        peer.sendall(frame(protocol.MSG_ZONE_RESTORED, b'003'))
+        assert recv_all(link, 10) == frame(protocol.MSG_ZONE_RESTORED, b'003')
+
+        # the bridge dropping the connection
+        peer.close()
+        with pytest.raises(ConnectionResetError):
+            recv_all(link, 64)
+
+        link.close()
+        with pytest.raises(ConnectionResetError):
+            link.recv(64)
+    finally:
+        server.close()
+
+
+def test_tcp_refused():
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(('127.0.0.1', 0))
+    port = server.getsockname()[1]
+    server.close()
+
+    conn = it100.DSCConnection(transport.TCPTransport('127.0.0.1', port))
+    conn.Connect()
+    assert not conn.connected
+
+
+def test_parser_split_frames():
+    data = (frame(protocol.MSG_ZONE_OPEN, b'001') +
+            frame(protocol.MSG_ZONE_RESTORED, b'001') +
+            b'12:30:05 ' + frame(protocol.MSG_PANEL_AC_TROUBLE))
+
+    # every split point, and one byte at a time
+    for split in range(len(data) + 1):
+        parser = it100.FrameParser()
+        messages = parser.feed(data[:split]) + parser.feed(data[split:])
+        assert [(m.command, m.data) for m in messages] == [
+                (protocol.MSG_ZONE_OPEN, b'001'),
+                (protocol.MSG_ZONE_RESTORED, b'001'),
+                (protocol.MSG_PANEL_AC_TROUBLE, b''),
+                ]
+        assert messages[2].timestamp == '12:30:05'
+
+    parser = it100.FrameParser()
+    messages = []
+    for i in range(len(data)):
+        messages += parser.feed(data[i:i + 1])
+    assert len(messages) == 3
+
+
+def test_parser_discards_garbage():
+    parser = it100.FrameParser()
+    assert parser.feed(b'x' * (it100.MAX_FRAME + 1)) == []
+    assert len(parser.buf) == 0
+    assert len(parser.feed(frame(protocol.MSG_ZONE_OPEN, b'004'))) == 1
+
+
+def test_loop():
+    (peer, local) = socket.socketpair()
+    peer.settimeout(5)
+
+    # a TCP transport on one end of a socket pair
+    link = transport.TCPTransport('127.0.0.1', 0, timeout=0.1)
+    link.open = lambda: setattr(link, 'sock', local)
+    local.settimeout(link.timeout)
+
+    conn = it100.DSCConnection(link)
+    conn.Connect()
+    assert conn.connected
+
+    received = []
+    flushes = []
+    loop = threading.Thread(target=conn.Loop, args=(received.append, lambda: flushes.append(len(received))))
+    loop.start()
+
+    # one frame split over two sends, then two frames in one
+    data = frame(protocol.MSG_ZONE_OPEN, b'005')
+    peer.sendall(data[:5])
+    peer.sendall(data[5:] + frame(protocol.MSG_ZONE_RESTORED, b'005') + frame(protocol.MSG_PANEL_AC_RESTORED))
+
+    conn.Send(protocol.DSCMessage(protocol.CMD_STATUS_REQUEST, b''))
+    assert peer.recv(1024) == frame(protocol.CMD_STATUS_REQUEST)
+
+    # the panel going away ends the loop
+    peer.shutdown(socket.SHUT_RDWR)
+    loop.join(5)
+    peer.close()
+
+    assert not loop.is_alive()
+    assert not conn.connected
+    assert [(m.command, m.data) for m in received] == [
+            (protocol.MSG_ZONE_OPEN, b'005'),
+            (protocol.MSG_ZONE_RESTORED, b'005'),
+            (protocol.MSG_PANEL_AC_RESTORED, b''),
+            ]
+    assert flushes and flushes[-1] == 3
+
+    conn.Close()
+
+
+def test_loop_close():
+    (peer, local) = socket.socketpair()
+    link = transport.TCPTransport('127.0.0.1', 0, timeout=0.1)
+    link.open = lambda: setattr(link, 'sock', local)
+    local.settimeout(link.timeout)
+
+    conn = it100.DSCConnection(link)
+    conn.Connect()
+    loop = threading.Thread(target=conn.Loop, args=(lambda m: None,))
+    loop.start()
+
+    # closing from another thread stops the loop
+    conn.Close()
+    loop.join(5)
+    peer.close()
+    assert not loop.is_alive()
+
+
+def test_send_closed():
+    # closed before it was ever opened, and after
+    links = [
+            transport.TCPTransport('127.0.0.1', 4999),
+            transport.UDPTransport('127.0.0.1', 4999),
+            transport.SerialTransport('/dev/null'),
+            ]
+    for link in links:
+        with pytest.raises(ConnectionResetError):
+            link.send(b'001')
+
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(('127.0.0.1', 0))
+    server.listen(1)
+    try:
+        conn = it100.DSCConnection(transport.TCPTransport('127.0.0.1', server.getsockname()[1]))
+        conn.Connect()
+        assert conn.connected
+        conn.Close()
+
+        # logged and marked disconnected, not raised
+        conn.connected = True
+        conn.StatusRequest()
+        assert not conn.connected
+    finally:
+        server.close()
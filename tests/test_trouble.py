@@ -0,0 +1,146 @@
+#
+#  Tests for the trouble model and publishing troubles to the nodes.
+
+import protocol
+import replay
+import trouble
+
+
+def test_codes():
+    # every message has a restore for the same bit
+    for (command, (scope, bit, on)) in trouble.CODES.items():
+        assert (scope, bit, not on) in trouble.CODES.values()
+    assert len(trouble.CODES) == 22
+
+
+def test_not_trouble():
+    model = trouble.TroubleModel()
+    assert not model.apply(protocol.MSG_ZONE_OPEN, b'001')
+    assert model.changes() == []
+
+
+def test_panel():
+    model = trouble.TroubleModel()
+    assert model.apply(protocol.MSG_PANEL_AC_TROUBLE, b'')
+    assert model.apply(protocol.MSG_SYSTEM_BELL_TROUBLE, b'')
+    assert model.panel == trouble.AC | trouble.BELL
+    assert model.changes() == [(trouble.PANEL, 0, trouble.AC | trouble.BELL)]
+
+    model.done(trouble.PANEL, 0)
+    model.apply(protocol.MSG_PANEL_AC_RESTORED, b'')
+    assert model.changes() == [(trouble.PANEL, 0, trouble.BELL)]
+
+    # no change, nothing to publish
+    model.done(trouble.PANEL, 0)
+    model.apply(protocol.MSG_PANEL_AC_RESTORED, b'')
+    assert model.changes() == []
+
+
+def test_partition():
+    model = trouble.TroubleModel()
+    model.apply(protocol.MSG_PARTITION_TROUBLE, b'1')
+    model.apply(protocol.MSG_PARTITION_TROUBLE, b'2')
+    assert model.partitions[1] == trouble.TROUBLE
+    assert model.partitions[2] == trouble.TROUBLE
+    assert model.panel == trouble.PARTITION_TROUBLE
+
+    # the panel bit stays until every partition is restored
+    model.apply(protocol.MSG_PARTITION_TROUBLE_RESTORED, b'1')
+    assert model.panel == trouble.PARTITION_TROUBLE
+    model.apply(protocol.MSG_PARTITION_TROUBLE_RESTORED, b'2')
+    assert model.panel == 0
+
+    # out of range
+    model.apply(protocol.MSG_PARTITION_TROUBLE, b'9')
+    assert model.panel == 0
+
+
+def test_zone_prefix():
+    model = trouble.TroubleModel()
+    # zone number alone and with the partition in front
+    model.apply(protocol.MSG_ZONE_TAMPER, b'005')
+    model.apply(protocol.MSG_ZONE_FAULT, b'1012')
+    assert model.zones[5] == trouble.ZONE_TAMPER
+    assert model.zones[12] == trouble.ZONE_FAULT
+    assert model.changes() == [
+            (trouble.ZONE, 5, trouble.ZONE_TAMPER),
+            (trouble.ZONE, 12, trouble.ZONE_FAULT),
+            ]
+
+
+def test_bad_zone():
+    model = trouble.TroubleModel()
+    assert model.apply(protocol.MSG_ZONE_FAULT, b'065')
+    assert model.apply(protocol.MSG_ZONE_FAULT, b'0x1')
+    assert model.zones == [0] * (trouble.MAX_ZONES + 1)
+    assert model.changes() == []
+
+
+def test_low_battery():
+    model = trouble.TroubleModel()
+    model.apply(protocol.MSG_GENERAL_DEV_LOW_BATTERY, b'003')
+    model.apply(protocol.MSG_GENERAL_DEV_LOW_BATTERY, b'007')
+    assert model.panel == trouble.DEVICE_LOW_BATTERY
+
+    model.apply(protocol.MSG_GENERAL_DEV_LOW_BATTERY_RESTORED, b'003')
+    assert model.panel == trouble.DEVICE_LOW_BATTERY
+    model.apply(protocol.MSG_GENERAL_DEV_LOW_BATTERY_RESTORED, b'007')
+    assert model.panel == 0
+
+
+def test_low_battery_no_zone():
+    model = trouble.TroubleModel()
+    model.apply(protocol.MSG_GENERAL_DEV_LOW_BATTERY, b'')
+    assert model.zones[0] == trouble.ZONE_LOW_BATTERY
+    # only the panel has something to show
+    assert model.changes() == [(trouble.PANEL, 0, trouble.DEVICE_LOW_BATTERY)]
+
+    model.done(trouble.PANEL, 0)
+    model.apply(protocol.MSG_GENERAL_DEV_LOW_BATTERY_RESTORED, b'')
+    assert model.changes() == [(trouble.PANEL, 0, 0)]
+
+
+def test_retry():
+    model = trouble.TroubleModel()
+    model.apply(protocol.MSG_ZONE_TAMPER, b'004')
+    assert model.changes() == [(trouble.ZONE, 4, trouble.ZONE_TAMPER)]
+    # not published, it's returned again with the current bits
+    model.apply(protocol.MSG_ZONE_FAULT, b'004')
+    assert model.changes() == [(trouble.ZONE, 4, trouble.ZONE_TAMPER | trouble.ZONE_FAULT)]
+    model.done(trouble.ZONE, 4)
+    assert model.changes() == []
+
+
+def test_publish():
+    (poly, controller) = replay.build_controller(2)
+    try:
+        for (command, data) in [
+                (protocol.MSG_PANEL_AC_TROUBLE, b''),
+                (protocol.MSG_PARTITION_TROUBLE, b'1'),
+                (protocol.MSG_ZONE_TAMPER, b'002'),
+                (protocol.MSG_ZONE_FAULT, b'003'),
+                (protocol.MSG_GENERAL_DEV_LOW_BATTERY, b''),
+                ]:
+            controller.post(controller.processCommand, protocol.DSCMessage(command, data))
+        controller.post(controller.publish_troubles)
+        controller.sync()
+
+        assert controller.getDriver('GV3') == 1
+        assert controller.getDriver('GV6') == 1
+        assert controller.getDriver('GV9') == 1
+        assert poly.getNode('zone_2').getDriver('GV3') == 1
+        # zone 3 doesn't have a node yet
+        assert controller.troubles.changes() == [(trouble.ZONE, 3, trouble.ZONE_FAULT)]
+
+        controller.post(controller.discover)
+        controller.sync()
+        assert controller.troubles.changes() == [(trouble.ZONE, 3, trouble.ZONE_FAULT)]
+
+        from nodes import zone
+        poly.addNode(zone.Zone(poly, 'controller', 'zone_3', 'Zone 3'))
+        controller.post(controller.publish_troubles)
+        controller.sync()
+        assert poly.getNode('zone_3').getDriver('GV4') == 1
+        assert controller.troubles.changes() == []
+    finally:
+        controller.stop()
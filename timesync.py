@@ -0,0 +1,101 @@
+#
+#  Panel clock handling
+#
+#  Sets the panel clock when connected and then on a schedule, turns off
+#  the once a minute time broadcast and, when time stamps are enabled,
+#  converts the time stamp on each message into a full date/time.
+
+import datetime
+import logging
+import time
+import protocol
+
+_LOGGER = logging.getLogger(__name__)
+
+MAX_DRIFT = 120        # seconds before a broadcast triggers a clock update
+DEFAULT_INTERVAL = 24  # hours
+
+class TimeSync:
+    def __init__(self, interval=DEFAULT_INTERVAL, timestamps=False):
+        self.interval = interval       # hours between setting the clock, 0 = never
+        self.timestamps = timestamps   # ask the IT-100 to time stamp messages
+        self.last_set = None
+        self.drift = None
+        self.panel_time = None         # time from the last broadcast
+
+    """
+        Configure the IT-100 after a connect.  The time broadcast is
+        turned off since we set the clock ourselves.
+    """
+    def connected(self, conn):
+        conn.Send(protocol.DSCMessage(protocol.CMD_TIME_DATE_BCAST_CONTROL, b'0'))
+        conn.Send(protocol.DSCMessage(protocol.CMD_TIME_STAMP_CONTROL, b'1' if self.timestamps else b'0'))
+        if self.interval > 0:
+            self.set_clock(conn)
+
+    # Called from long poll to set the clock when it's due.
+    def poll(self, conn):
+        if self.interval <= 0:
+            return
+
+        if self.last_set is None or time.monotonic() - self.last_set >= self.interval * 3600:
+            self.set_clock(conn)
+
+    def set_clock(self, conn, now=None):
+        if now is None:
+            now = datetime.datetime.now()
+
+        _LOGGER.info('Setting panel clock to ' + now.strftime('%Y-%m-%d %H:%M'))
+        conn.Send(protocol.DSCMessage(protocol.CMD_SET_TIME_DATE, now.strftime('%H%M%m%d%y').encode()))
+        self.last_set = time.monotonic()
+        self.drift = None
+
+    """
+        Handle a time/date broadcast (hhmmMMDDYY).  Returns the panel
+        time, or None if the broadcast can't be parsed.
+    """
+    def broadcast(self, data):
+        try:
+            panel = datetime.datetime.strptime(data.decode(), '%H%M%m%d%y')
+        except ValueError:
+            _LOGGER.error('Bad time broadcast: ' + str(data))
+            return None
+
+        self.panel_time = panel
+        return panel
+
+    # Keep track of how far the panel time is from our clock.
+    def check_drift(self, panel, now=None):
+        if now is None:
+            now = datetime.datetime.now()
+        self.drift = (now - panel).total_seconds()
+        _LOGGER.debug('Panel time {} drift {:.0f} seconds'.format(panel, self.drift))
+
+    def needs_set(self):
+        return self.interval > 0 and self.drift is not None and abs(self.drift) > MAX_DRIFT
+
+    """
+        Return the time of the event for a message.  This is the panel's
+        time stamp if there is one, otherwise the current time.  The time
+        stamp doesn't have a date so one just before midnight that is
+        processed after midnight belongs to yesterday, and one just after
+        midnight from a panel clock that is ahead belongs to tomorrow.
+    """
+    def event_time(self, msg, now=None):
+        if now is None:
+            now = datetime.datetime.now()
+
+        if msg.timestamp is None:
+            return now
+
+        try:
+            stamp = datetime.datetime.strptime(msg.timestamp, '%H:%M:%S').time()
+        except ValueError:
+            return now
+
+        event = datetime.datetime.combine(now.date(), stamp)
+        if event - now > datetime.timedelta(hours=12):
+            event -= datetime.timedelta(days=1)
+        elif now - event > datetime.timedelta(hours=12):
+            event += datetime.timedelta(days=1)
+        return event
@@ -0,0 +1,153 @@
+#
+#  Trouble and fault tracking
+#
+#  Trouble state is kept as a bitset for the panel, each partition and
+#  each zone.  Changes are collected so they can be published together
+#  once all the messages in a receive have been processed.
+
+import logging
+import protocol
+
+_LOGGER = logging.getLogger(__name__)
+
+PANEL = 0
+PARTITION = 1
+ZONE = 2
+
+MAX_PARTITIONS = 8
+MAX_ZONES = 64
+
+# panel trouble bits
+BELL = 0x01
+BATTERY = 0x02
+AC = 0x04
+FTC = 0x08
+TAMPER = 0x10
+DEVICE_LOW_BATTERY = 0x20   # set if any zone/device has a low battery
+FIRE = 0x40
+KEYBUS = 0x80
+PARTITION_TROUBLE = 0x100   # set if any partition is in trouble
+
+# partition trouble bits
+TROUBLE = 0x01
+
+# zone trouble bits
+ZONE_TAMPER = 0x01
+ZONE_FAULT = 0x02
+ZONE_LOW_BATTERY = 0x04
+
+# message: (scope, bit, trouble set)
+CODES = {
+        protocol.MSG_SYSTEM_BELL_TROUBLE: (PANEL, BELL, True),
+        protocol.MSG_SYSTEM_BELL_RESTORED: (PANEL, BELL, False),
+        protocol.MSG_PANEL_BATTERY_TROUBLE: (PANEL, BATTERY, True),
+        protocol.MSG_PANEL_BATTERY_RESTORED: (PANEL, BATTERY, False),
+        protocol.MSG_PANEL_AC_TROUBLE: (PANEL, AC, True),
+        protocol.MSG_PANEL_AC_RESTORED: (PANEL, AC, False),
+        protocol.MSG_FTC_TROUBLE: (PANEL, FTC, True),
+        protocol.MSG_FTC_RESTORED: (PANEL, FTC, False),
+        protocol.MSG_GENERAL_SYSTEM_TAMPER: (PANEL, TAMPER, True),
+        protocol.MSG_GENERAL_SYSTEM_TAMPER_RESTORED: (PANEL, TAMPER, False),
+        protocol.MSG_FIRE_TROUBLE_ALARM: (PANEL, FIRE, True),
+        protocol.MSG_FIRE_TROUBLE_RESTORED: (PANEL, FIRE, False),
+        protocol.MSG_KEYBUS_FAULT: (PANEL, KEYBUS, True),
+        protocol.MSG_KEYBUS_RESTORED: (PANEL, KEYBUS, False),
+        protocol.MSG_PARTITION_TROUBLE: (PARTITION, TROUBLE, True),
+        protocol.MSG_PARTITION_TROUBLE_RESTORED: (PARTITION, TROUBLE, False),
+        protocol.MSG_ZONE_TAMPER: (ZONE, ZONE_TAMPER, True),
+        protocol.MSG_ZONE_TAMPER_RESTORE: (ZONE, ZONE_TAMPER, False),
+        protocol.MSG_ZONE_FAULT: (ZONE, ZONE_FAULT, True),
+        protocol.MSG_ZONE_FAULT_RESTORE: (ZONE, ZONE_FAULT, False),
+        protocol.MSG_GENERAL_DEV_LOW_BATTERY: (ZONE, ZONE_LOW_BATTERY, True),
+        protocol.MSG_GENERAL_DEV_LOW_BATTERY_RESTORED: (ZONE, ZONE_LOW_BATTERY, False),
+        }
+
+class TroubleModel:
+    def __init__(self):
+        self.panel = 0
+        self.partitions = [0] * (MAX_PARTITIONS + 1)
+        # zone 0 holds troubles reported without a zone number
+        self.zones = [0] * (MAX_ZONES + 1)
+        self.dirty = set()
+
+    """
+        Update the model from a trouble message.  Returns False if the
+        message isn't a trouble message.  when is the panel time of the
+        message, if it has one, for the log.
+    """
+    def apply(self, command, data, when=None):
+        if command not in CODES:
+            return False
+
+        (scope, bit, on) = CODES[command]
+
+        if scope == PANEL:
+            self._set_panel(bit, on)
+        elif scope == PARTITION:
+            index = self._index(data, 1, MAX_PARTITIONS)
+            if index is None:
+                return True
+            if self._set(self.partitions, index, bit, on):
+                self.dirty.add((PARTITION, index))
+                self._set_panel(PARTITION_TROUBLE, any(self.partitions))
+        else:
+            # zone messages may have the partition in front of the zone
+            index = self._index(data, 3, MAX_ZONES)
+            if index is None:
+                return True
+            if self._set(self.zones, index, bit, on):
+                # zone 0 has no node, the panel's device low battery
+                # covers it
+                if index > 0:
+                    self.dirty.add((ZONE, index))
+                if bit == ZONE_LOW_BATTERY:
+                    low = any(z & ZONE_LOW_BATTERY for z in self.zones)
+                    self._set_panel(DEVICE_LOW_BATTERY, low)
+
+        _LOGGER.info('Trouble {} {}{}'.format(command.decode(), 'set' if on else 'restored',
+                ' at {}'.format(when) if when is not None else ''))
+        return True
+
+    def _index(self, data, digits, limit):
+        if len(data) == 0:
+            return 0
+        try:
+            index = int(data[-digits:].decode())
+        except ValueError:
+            _LOGGER.error('Bad trouble data: ' + str(data))
+            return None
+
+        if index > limit:
+            _LOGGER.error('Trouble for unknown {}: {}'.format('zone' if digits == 3 else 'partition', index))
+            return None
+        return index
+
+    def _set(self, table, index, bit, on):
+        old = table[index]
+        table[index] = (old | bit) if on else (old & ~bit)
+        return table[index] != old
+
+    def _set_panel(self, bit, on):
+        old = self.panel
+        self.panel = (old | bit) if on else (old & ~bit)
+        if self.panel != old:
+            self.dirty.add((PANEL, 0))
+
+    """
+        Return the (scope, index, bits) that have changed and haven't
+        been published yet.  Call done() for each one that is published,
+        the others are returned again next time.
+    """
+    def changes(self):
+        changed = []
+        for (scope, index) in sorted(self.dirty):
+            if scope == PANEL:
+                changed.append((scope, index, self.panel))
+            elif scope == PARTITION:
+                changed.append((scope, index, self.partitions[index]))
+            else:
+                changed.append((scope, index, self.zones[index]))
+        return changed
+
+    def done(self, scope, index):
+        self.dirty.discard((scope, index))